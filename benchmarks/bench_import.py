@@ -0,0 +1,87 @@
+# bench_import.py
+# Cold import-time benchmark for file_docker/app.py (and the plugin launcher).
+#
+# Each run imports the module in a fresh interpreter, with none of the
+# NOTION_*/IMAP_* variables set, and reports the median import time plus any
+# heavy dependency that got imported eagerly.
+#
+# Usage:
+#   python benchmarks/bench_import.py
+#   python benchmarks/bench_import.py --module start_with_plugin --runs 20
+#   python benchmarks/bench_import.py --max-ms 50   # exit 1 if slower (CI guard)
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+APP_DIR = os.path.join(ROOT, "file_docker")
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = ["notion_client", "httpx", "bs4", "requests"]
+
+# The launcher imports app lazily inside main(), so time both to get the
+# real cold start of `python start_with_plugin.py`.
+IMPORTS = {"start_with_plugin": "start_with_plugin, app"}
+
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import {imports}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"elapsed": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_once(module):
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("NOTION_", "IMAP_", "LINE_ITEMS_"))}
+    env["PYTHONPATH"] = os.pathsep.join([APP_DIR, ROOT] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(imports=IMPORTS.get(module, module), heavy=HEAVY_MODULES)],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cold import-time benchmark")
+    ap.add_argument("--module", default="app", help="module to import (app, or start_with_plugin which also imports app)")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--max-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args(argv)
+
+    # warm the OS page cache / .pyc files once before measuring
+    run_once(args.module)
+    results = [run_once(args.module) for _ in range(args.runs)]
+    times = [r["elapsed"] * 1000 for r in results]
+    heavy = sorted({m for r in results for m in r["heavy"]})
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+        "eager_heavy_modules": heavy,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {report['module']:<18}: median {report['median_ms']:.2f} ms (min {report['min_ms']:.2f}, max {report['max_ms']:.2f}, {args.runs} runs)")
+        print(f"eager heavy modules    : {', '.join(heavy) if heavy else 'none'}")
+
+    if args.max_ms is not None and report["median_ms"] > args.max_ms:
+        print(f"FAIL: median import time {report['median_ms']:.2f} ms > {args.max_ms} ms", file=sys.stderr)
+        sys.exit(1)
+    if heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
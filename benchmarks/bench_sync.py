@@ -0,0 +1,280 @@
+# bench_sync.py
+# Offline throughput benchmark for the sync loop in file_docker/app.py.
+#
+# Starts a fake IMAP server seeded with a synthetic corpus and a mock Notion API
+# (each in its own subprocess, so they don't share the GIL or the memory figures
+# with the code under test), points app.py at them and runs one real poll cycle.
+#
+# Usage:
+#   python benchmarks/bench_sync.py --messages 500 --html-ratio 0.7 --notion-latency 0.05
+#   python benchmarks/bench_sync.py --rate-limit-ratio 0.05 --json
+#   python benchmarks/bench_sync.py --plugin custom_filter --spam-ratio 0.3
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import ssl
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+APP_DIR = os.path.join(ROOT, "file_docker")
+for p in (HERE, APP_DIR, ROOT):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+from corpus import build_corpus
+from fake_imap import FakeIMAPServer
+from mock_notion import MockNotionServer
+
+
+def _serve(factory, conn):
+    server = factory()
+    conn.send((server.server_address[1], getattr(server, "info", {})))
+    conn.close()
+    server.serve_forever()
+
+
+def start_server(factory):
+    """Start `factory()` (a socketserver) in a subprocess and return (process, port, info)."""
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_serve, args=(factory, child), daemon=True)
+    proc.start()
+    port, info = parent.recv()
+    return proc, port, info
+
+
+def imap_server(folders, corpus_opts, latency):
+    """Build the synthetic corpus and the fake IMAP server (runs in the server subprocess,
+    so the corpus never counts towards the benchmarked process' memory)."""
+    mailboxes = {}
+    for n, folder in enumerate(folders):
+        opts = dict(corpus_opts, seed=corpus_opts["seed"] + n)
+        mailboxes[folder] = build_corpus(**opts)
+    return FakeIMAPServer(mailboxes, latency=latency)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (pct in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def peak_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Offline imap-notion-sync benchmark")
+    corpus = ap.add_argument_group("corpus")
+    corpus.add_argument("--messages", type=int, default=200, help="number of messages per folder")
+    corpus.add_argument("--folders", default="INBOX", help="comma separated folder names")
+    corpus.add_argument("--min-size", type=int, default=500, help="min body size (chars)")
+    corpus.add_argument("--max-size", type=int, default=5000, help="max body size (chars)")
+    corpus.add_argument("--html-ratio", type=float, default=0.5, help="fraction of messages with an HTML part")
+    corpus.add_argument("--attachment-ratio", type=float, default=0.1, help="fraction of messages with attachments")
+    corpus.add_argument("--attachment-size", type=int, default=20_000, help="bytes per attachment")
+    corpus.add_argument("--max-attachments", type=int, default=2, help="max attachments per message")
+    corpus.add_argument("--duplicate-ratio", type=float, default=0.05, help="fraction of messages reusing an earlier Message-ID")
+    corpus.add_argument("--spam-ratio", type=float, default=0.0, help="fraction of messages from spamdomain.com")
+    corpus.add_argument("--seed", type=int, default=0)
+
+    servers = ap.add_argument_group("servers")
+    servers.add_argument("--imap-latency", type=float, default=0.0, help="seconds slept per IMAP FETCH command")
+    servers.add_argument("--notion-latency", type=float, default=0.0, help="seconds slept per Notion request")
+    servers.add_argument("--rate-limit-ratio", type=float, default=0.0, help="probability of a 429 per Notion request")
+
+    app_opts = ap.add_argument_group("app")
+    app_opts.add_argument("--batch-size", type=int, default=50)
+    app_opts.add_argument("--rate-delay", type=float, default=0.0, help="NOTION_RATE_DELAY for the run (app default is 0.1)")
+    app_opts.add_argument("--upload-files", action="store_true", help="enable NOTION_UPLOAD_FILES")
+    app_opts.add_argument("--plugin", default=None, help="filter plugin module to load (e.g. custom_filter)")
+    app_opts.add_argument("--log-level", default="CRITICAL", help="LOG_LEVEL for the app (default keeps the report readable)")
+
+    ap.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slows the run down)")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    return ap.parse_args(argv)
+
+
+def run(args):
+    folders = [f.strip() for f in args.folders.split(",") if f.strip()]
+    corpus_opts = {
+        "count": args.messages,
+        "min_size": args.min_size,
+        "max_size": args.max_size,
+        "html_ratio": args.html_ratio,
+        "attachment_ratio": args.attachment_ratio,
+        "attachment_size": args.attachment_size,
+        "max_attachments": args.max_attachments,
+        "duplicate_ratio": args.duplicate_ratio,
+        "spam_ratio": args.spam_ratio,
+        "seed": args.seed,
+    }
+    imap_proc, imap_port, corpus_info = start_server(functools.partial(imap_server, folders, corpus_opts, args.imap_latency))
+    notion_proc, notion_port, _ = start_server(functools.partial(
+        MockNotionServer, latency=args.notion_latency, rate_limit_ratio=args.rate_limit_ratio, seed=args.seed,
+    ))
+    notion_base = f"http://127.0.0.1:{notion_port}"
+
+    workdir = tempfile.mkdtemp(prefix="imap-notion-bench-")
+    try:
+        import imaplib
+        import app
+
+        cfg = app.Config(
+            notion_token="bench-token",
+            line_db_id="bench-db",
+            imap_host="127.0.0.1",
+            imap_port=imap_port,
+            imap_user="bench",
+            imap_password="bench",
+            folders=folders,
+            batch_size=args.batch_size,
+            processed_store_path=os.path.join(workdir, "processed.json"),
+            attachments_dir=os.path.join(workdir, "attachments"),
+            notion_upload_files=args.upload_files,
+            notion_api_base=notion_base,
+            notion_rate_delay=args.rate_delay,
+            log_level=args.log_level.upper(),
+        )
+        app.set_config(cfg)
+        app.configure_logging(cfg.log_level)
+        if args.plugin:
+            app.load_plugin(args.plugin)
+        # Import notion_client and build the client now, so the one-off cost of
+        # the lazy import doesn't land in the first message's latency
+        app.get_notion(cfg)
+
+        # The fake server speaks plain IMAP
+        app.IMAP4_SSL = lambda host, port, ssl_context=None: imaplib.IMAP4(host, port)
+
+        # Per-message latency = parse time + page creation time, keyed by (folder, uid)
+        timings = {}
+        orig_parse, orig_process = app.parse_message, app.process_message
+
+        def timed_parse_message(uid, item, folder):
+            t0 = time.perf_counter()
+            try:
+                return orig_parse(uid, item, folder)
+            finally:
+                timings[(folder, uid)] = time.perf_counter() - t0
+
+        # Messages left for the next poll because Notion was still rate limited
+        deferred = []
+
+        def timed_process_message(msg, *a, **kw):
+            t0 = time.perf_counter()
+            try:
+                result = orig_process(msg, *a, **kw)
+            finally:
+                key = (msg["folder"], msg["uid"])
+                timings[key] = timings.get(key, 0.0) + time.perf_counter() - t0
+            if result is False:
+                deferred.append(key)
+            return result
+
+        app.parse_message = timed_parse_message
+        app.process_message = timed_process_message
+
+        # Pages that could not be created, and attachments that could not be
+        # uploaded, because of an error (rate limiting defers the whole message)
+        failed_pages, failed_uploads = [], []
+        orig_create, orig_upload = app.create_email_page, app.upload_attachment_and_get_upload_id
+
+        def counted_create_email_page(msgid, *a, **kw):
+            page = orig_create(msgid, *a, **kw)
+            if page is None:
+                failed_pages.append(msgid)
+            return page
+
+        def counted_upload(file_bytes, filename, *a, **kw):
+            upload_id = orig_upload(file_bytes, filename, *a, **kw)
+            if upload_id is None:
+                failed_uploads.append(filename)
+            return upload_id
+
+        app.create_email_page = counted_create_email_page
+        app.upload_attachment_and_get_upload_id = counted_upload
+
+        store = app.load_store(cfg.processed_store_path)
+        initial_since = datetime.now(timezone.utc) - timedelta(days=cfg.since_days)
+        last_sync = {f: initial_since for f in cfg.folders}
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        app.poll_once(ssl.create_default_context(), store, last_sync, initial_since, cfg)
+        elapsed = time.perf_counter() - t0
+        heap_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+        with urllib.request.urlopen(f"{notion_base}/__stats") as resp:
+            notion_stats = json.load(resp)
+    finally:
+        for proc in (imap_proc, notion_proc):
+            proc.terminate()
+            proc.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = list(timings.values())
+    # Throughput counts every message in the mailboxes that was handled, including
+    # those the plugin rejected from headers alone (which are never parsed), but
+    # not the ones whose page could not be created or that were deferred.
+    total = corpus_info.get("messages", 0)
+    synced = total - len(failed_pages) - len(deferred)
+    report = {
+        "messages": total,
+        "parsed": len(latencies),
+        "failed_pages": len(failed_pages),
+        "deferred": len(deferred),
+        "failed_uploads": len(failed_uploads),
+        "corpus_bytes": corpus_info.get("bytes", 0),
+        "elapsed_s": round(elapsed, 4),
+        "messages_per_s": round(synced / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "notion": notion_stats,
+    }
+    if heap_peak is not None:
+        report["peak_heap_bytes"] = heap_peak
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"messages        : {report['messages']} ({report['corpus_bytes'] / 1e6:.2f} MB corpus, {report['parsed']} parsed)")
+    print(f"elapsed         : {report['elapsed_s']:.3f} s")
+    print(f"throughput      : {report['messages_per_s']:.2f} msg/s")
+    print(f"latency p50/p99 : {report['latency_p50_ms']:.2f} / {report['latency_p99_ms']:.2f} ms")
+    print(f"peak RSS        : {report['peak_rss_bytes'] / 1e6:.1f} MB")
+    if "peak_heap_bytes" in report:
+        print(f"peak heap       : {report['peak_heap_bytes'] / 1e6:.1f} MB")
+    n = report["notion"]
+    print(f"notion          : {n['pages']} pages, {n['uploads']} uploads, {n['rate_limited']}/{n['requests']} requests rate-limited")
+    print(f"failed pages    : {report['failed_pages']} (not counted in throughput)")
+    print(f"deferred        : {report['deferred']} (still rate limited, not counted in throughput)")
+    print(f"failed uploads  : {report['failed_uploads']} attachments not uploaded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# corpus.py
+# Synthetic mail corpus used by the offline benchmarks.
+
+import random
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+from datetime import datetime, timezone
+
+WORDS = (
+    "ordine spedizione fattura consegna pacco cliente prodotto pagamento "
+    "invoice order shipping tracking account update report meeting notes "
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod"
+).split()
+
+ATTACHMENT_TYPES = [
+    ("application", "pdf", "pdf"),
+    ("image", "png", "png"),
+    ("text", "csv", "csv"),
+]
+
+
+def _text(rng, size):
+    """Return roughly `size` characters of pseudo-random words."""
+    out, n = [], 0
+    while n < size:
+        w = rng.choice(WORDS)
+        out.append(w)
+        n += len(w) + 1
+    return " ".join(out)
+
+
+def build_message(rng, index, body_size, html=False, attachments=0, attachment_size=0, msgid=None, domain="example.com"):
+    """Build a single RFC822 message and return its bytes."""
+    msg = EmailMessage()
+    msg["From"] = f"sender{index % 50}@{domain}"
+    msg["To"] = "bench@example.com"
+    msg["Subject"] = f"Bench message {index}: {_text(rng, 40)}"
+    msg["Date"] = format_datetime(datetime.now(timezone.utc))
+    msg["Message-ID"] = msgid or make_msgid(idstring=str(index), domain="bench.local")
+
+    text = _text(rng, body_size)
+    if html:
+        paragraphs = "".join(f"<p>{_text(rng, 80)}</p>" for _ in range(max(1, body_size // 80)))
+        msg.set_content(text)
+        msg.add_alternative(f"<html><body><div>{paragraphs}</div><table><tr><td>{index}</td></tr></table></body></html>", subtype="html")
+    else:
+        msg.set_content(text)
+
+    for a in range(attachments):
+        maintype, subtype, ext = rng.choice(ATTACHMENT_TYPES)
+        data = rng.randbytes(attachment_size)
+        msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=f"file_{index}_{a}.{ext}")
+
+    return msg.as_bytes()
+
+
+def build_corpus(count=200, min_size=500, max_size=5000, html_ratio=0.5, attachment_ratio=0.1,
+                 attachment_size=20_000, max_attachments=2, duplicate_ratio=0.0, spam_ratio=0.0, seed=0):
+    """Return a list of `count` raw messages.
+
+    - message body sizes are drawn uniformly from [min_size, max_size] characters
+    - `html_ratio` of the messages carry a text/html alternative part
+    - `attachment_ratio` of the messages carry 1..max_attachments attachments of `attachment_size` bytes
+    - `duplicate_ratio` of the messages reuse the Message-ID of an earlier message
+      (exercises the dedup store, like the same mail appearing in two folders)
+    - `spam_ratio` of the messages come from spamdomain.com, which the example
+      custom_filter.on_headers rejects before the body is fetched
+    """
+    rng = random.Random(seed)
+    messages = []
+    msgids = []
+    for i in range(count):
+        if msgids and rng.random() < duplicate_ratio:
+            msgid = rng.choice(msgids)
+        else:
+            msgid = f"<bench-{i}@bench.local>"
+            msgids.append(msgid)
+        html = rng.random() < html_ratio
+        n_att = rng.randint(1, max_attachments) if rng.random() < attachment_ratio else 0
+        raw = build_message(
+            rng, i,
+            body_size=rng.randint(min_size, max_size),
+            html=html,
+            attachments=n_att,
+            attachment_size=attachment_size,
+            msgid=msgid,
+            domain="spamdomain.com" if rng.random() < spam_ratio else "example.com",
+        )
+        messages.append(raw)
+    return messages
+
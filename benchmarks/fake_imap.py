@@ -0,0 +1,149 @@
+# fake_imap.py
+# Minimal in-memory IMAP4rev1 stand-in, just enough for the commands app.py issues
+# (CAPABILITY, LOGIN, SELECT/EXAMINE, [UID] SEARCH, [UID] FETCH, NOOP, LOGOUT).
+# FETCH supports FLAGS, INTERNALDATE, RFC822 and BODY.PEEK[HEADER].
+# Plain TCP, no TLS: the benchmark swaps app.IMAP4_SSL for imaplib.IMAP4.
+
+import re
+import socketserver
+import time
+from datetime import datetime, timezone
+
+
+def _parse_seq(seq, maximum):
+    """Expand an IMAP sequence set like `1,3,5:7,9:*` into a list of ints."""
+    out = []
+    for part in seq.split(","):
+        if ":" in part:
+            lo, hi = part.split(":", 1)
+            lo = maximum if lo == "*" else int(lo)
+            hi = maximum if hi == "*" else int(hi)
+            if lo > hi:
+                lo, hi = hi, lo
+            out.extend(range(lo, hi + 1))
+        elif part:
+            out.append(maximum if part == "*" else int(part))
+    return out
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data)
+
+    def handle(self):
+        self.folder = None
+        self.send("* OK [CAPABILITY IMAP4rev1] fake-imap ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                tag, rest = line.decode(errors="ignore").rstrip("\r\n").split(" ", 1)
+            except ValueError:
+                continue
+            parts = rest.split(" ", 1)
+            cmd = parts[0].upper()
+            args = parts[1] if len(parts) > 1 else ""
+            use_uid = False
+            if cmd == "UID":
+                use_uid = True
+                parts = args.split(" ", 1)
+                cmd = parts[0].upper()
+                args = parts[1] if len(parts) > 1 else ""
+
+            handler = getattr(self, "do_" + cmd, None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command {cmd}\r\n")
+                continue
+            if handler(tag, args, use_uid) is False:
+                return
+
+    # --- commands ---
+    def do_CAPABILITY(self, tag, args, use_uid):
+        self.send(f"* CAPABILITY IMAP4rev1\r\n{tag} OK CAPABILITY completed\r\n")
+
+    def do_NOOP(self, tag, args, use_uid):
+        self.send(f"{tag} OK NOOP completed\r\n")
+
+    def do_LOGIN(self, tag, args, use_uid):
+        self.send(f"{tag} OK LOGIN completed\r\n")
+
+    def do_LOGOUT(self, tag, args, use_uid):
+        self.send(f"* BYE fake-imap logging out\r\n{tag} OK LOGOUT completed\r\n")
+        return False
+
+    def do_SELECT(self, tag, args, use_uid, readonly=False):
+        name = args.strip().strip('"')
+        if name not in self.server.mailboxes:
+            self.send(f"{tag} NO mailbox {name} does not exist\r\n")
+            return
+        self.folder = name
+        n = len(self.server.mailboxes[name])
+        mode = "READ-ONLY" if readonly else "READ-WRITE"
+        self.send(
+            f"* {n} EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen \\Answered \\Flagged \\Deleted \\Draft)\r\n"
+            f"* OK [UIDVALIDITY 1] UIDs valid\r\n{tag} OK [{mode}] completed\r\n"
+        )
+
+    def do_EXAMINE(self, tag, args, use_uid):
+        return self.do_SELECT(tag, args, use_uid, readonly=True)
+
+    def do_SEARCH(self, tag, args, use_uid):
+        if self.folder is None:
+            self.send(f"{tag} BAD no mailbox selected\r\n")
+            return
+        # Every message is delivered "now", so any SINCE criteria matches all of them.
+        ids = " ".join(str(i) for i in range(1, len(self.server.mailboxes[self.folder]) + 1))
+        self.send(f"* SEARCH {ids}\r\n{tag} OK SEARCH completed\r\n")
+
+    def do_FETCH(self, tag, args, use_uid):
+        if self.folder is None:
+            self.send(f"{tag} BAD no mailbox selected\r\n")
+            return
+        seq, items = args.split(" ", 1)
+        items = items.upper()
+        messages = self.server.mailboxes[self.folder]
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        internal_date = datetime.now(timezone.utc).strftime("%d-%b-%Y %H:%M:%S +0000")
+        # UIDs and sequence numbers coincide: messages are numbered 1..N and never expunged.
+        for n in _parse_seq(seq, len(messages)):
+            if n < 1 or n > len(messages):
+                continue
+            fields = [f"UID {n}"]
+            if "FLAGS" in items:
+                fields.append("FLAGS ()")
+            if "INTERNALDATE" in items:
+                fields.append(f'INTERNALDATE "{internal_date}"')
+            if "BODY.PEEK[HEADER]" in items or "BODY[HEADER]" in items:
+                raw = messages[n - 1]
+                head = re.split(rb"\r?\n\r?\n", raw, maxsplit=1)[0] + b"\r\n\r\n"
+                self.send(f"* {n} FETCH ({' '.join(fields)} BODY[HEADER] {{{len(head)}}}\r\n".encode() + head + b")\r\n")
+            elif re.search(r"\bRFC822\b", items):
+                raw = messages[n - 1]
+                self.send(f"* {n} FETCH ({' '.join(fields)} RFC822 {{{len(raw)}}}\r\n".encode() + raw + b")\r\n")
+            else:
+                self.send(f"* {n} FETCH ({' '.join(fields)})\r\n")
+        self.send(f"{tag} OK FETCH completed\r\n")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """Serve `mailboxes` ({folder: [raw message bytes, ...]}) over plain IMAP.
+
+    `latency` is slept once per FETCH command to mimic a remote server.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mailboxes, latency=0.0, host="127.0.0.1", port=0):
+        self.mailboxes = mailboxes
+        self.latency = latency
+        self.info = {
+            "messages": sum(len(m) for m in mailboxes.values()),
+            "bytes": sum(len(raw) for m in mailboxes.values() for raw in m),
+        }
+        super().__init__((host, port), IMAPHandler)
@@ -0,0 +1,99 @@
+# mock_notion.py
+# Local mock of the Notion endpoints used by app.py:
+#   POST /v1/pages                      (notion_client pages.create)
+#   POST /v1/file_uploads               (create_file_upload_object)
+#   POST /v1/file_uploads/<id>/send     (send_file_to_upload_url)
+# plus GET /__stats, which returns request counters as JSON.
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class NotionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/__stats":
+            with self.server.lock:
+                self._json(200, dict(self.server.stats))
+            return
+        self._json(404, {"object": "error", "status": 404, "code": "object_not_found", "message": self.path})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            throttled = server.rng.random() < server.rate_limit_ratio
+            server.stats["requests"] += 1
+            if throttled:
+                server.stats["rate_limited"] += 1
+        if throttled:
+            self._json(
+                429,
+                {"object": "error", "status": 429, "code": "rate_limited", "message": "Rate limited (mock)"},
+                headers={"Retry-After": str(server.retry_after)},
+            )
+            return
+
+        path = self.path.rstrip("/")
+        if path == "/v1/pages":
+            with server.lock:
+                server.stats["pages"] += 1
+            self._json(200, {"object": "page", "id": str(uuid.uuid4())})
+        elif path == "/v1/file_uploads":
+            upload_id = str(uuid.uuid4())
+            host, port = server.server_address[:2]
+            self._json(200, {
+                "object": "file_upload",
+                "id": upload_id,
+                "status": "pending",
+                "upload_url": f"http://{host}:{port}/v1/file_uploads/{upload_id}/send",
+            })
+        elif path.startswith("/v1/file_uploads/") and path.endswith("/send"):
+            with server.lock:
+                server.stats["uploads"] += 1
+            self._json(200, {"object": "file_upload", "id": path.split("/")[3], "status": "uploaded"})
+        else:
+            self._json(404, {"object": "error", "status": 404, "code": "object_not_found", "message": self.path})
+
+
+class MockNotionServer(ThreadingHTTPServer):
+    """Serve the mock Notion API.
+
+    - `latency`: seconds slept before answering each POST
+    - `rate_limit_ratio`: probability (0..1) of answering a POST with 429 rate_limited
+    - `retry_after`: value of the Retry-After header sent with 429 responses
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, rate_limit_ratio=0.0, retry_after=1, seed=0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "pages": 0, "uploads": 0}
+        super().__init__((host, port), NotionHandler)
@@ -1,14 +1,27 @@
 # custom_filter.py - example plugin
-# Implement `should_create_page(meta, body) -> bool | dict | None`.
+# Implement any of these hooks (all return a decision: bool | dict | None):
+# - `on_headers(meta)`: called with headers only, before the body is downloaded
+# - `decide_batch(messages)`: called once per IMAP batch, returns one decision per message
+#   (not defined here: it makes the app hold the whole parsed batch in memory,
+#   see the commented template below)
+# - `should_create_page(meta, body)`: per-message hook, used when `decide_batch` is not defined
+# Decisions:
 # - Return False or None to skip creating the Notion page
 # - Return True to allow creation
 # - Return dict to allow property overrides (example included below)
+# The module is reloaded automatically when this file changes.
 
 from datetime import datetime
+from email.utils import parseaddr
 import re
 import os
 
 
+def sender_address(meta):
+    """Return the bare, lower-cased sender address ('Name <a@b.com>' -> 'a@b.com')."""
+    return parseaddr(meta.get("from") or "")[1].lower()
+
+
 def rule_subject_contains(keyword, meta, body):
     """Return True if subject contains keyword (case-insensitive)."""
     subj = (meta.get("subject") or "").lower()
@@ -19,7 +32,7 @@ def rule_sender_whitelist(whitelist, meta, body):
     """Allow only senders in the whitelist (exact match or domain match).
     whitelist: list of addresses or domains (e.g. ['alerts@example.com', 'trusted.com'])
     """
-    sender = (meta.get("from") or "").lower()
+    sender = sender_address(meta)
     for w in whitelist:
         w = w.lower()
         if w.startswith("@"):
@@ -47,7 +60,7 @@ def rule_regex_subject(pattern, meta, body):
 
 def rule_blacklist_domains(domains, meta, body):
     """Skip messages from blacklisted domains."""
-    sender = (meta.get("from") or "").lower()
+    sender = sender_address(meta)
     for d in domains:
         if sender.endswith("@" + d.lower()):
             return False
@@ -55,9 +68,10 @@ def rule_blacklist_domains(domains, meta, body):
 
 
 def rule_return_props_example(meta, body):
-    """Example that returns a dict to instruct wrapper to modify Notion props.
-    The wrapper must be updated to consume this dict; shown here as an example.
-    Example return value:
+    """Example that returns a dict to modify the Notion page properties.
+    Each override value may be a raw Notion property value (dict) or a plain
+    value: str -> rich_text, list -> multi_select, bool -> checkbox, number -> number.
+    The property must exist in the database. Example return value:
       {"create": True, "properties_override": {"Tag": "invoice"}}
     """
     subj = (meta.get("subject") or "").lower()
@@ -66,6 +80,40 @@ def rule_return_props_example(meta, body):
     return None
 
 
+BLACKLISTED_DOMAINS = ["spamdomain.com", "marketing.example"]
+WHITELIST = ["orders@example.com", "spedizioni@brt.it", "trusted.com"]
+
+
+def on_headers(meta):
+    """
+    Early decision, called before the message body is downloaded.
+
+    `meta` has `uid`, `folder`, `message_id`, `from`, `subject` and `date`.
+    Return False to skip the message without fetching or parsing it.
+
+    Only reject here what `should_create_page` would reject anyway, with the
+    same precedence: invoices and whitelisted senders are allowed before the
+    domain blacklist is checked.
+    """
+    if rule_subject_contains("invoice", meta, None):
+        return True
+    if rule_sender_whitelist(WHITELIST, meta, None):
+        return True
+    return rule_blacklist_domains(BLACKLISTED_DOMAINS, meta, None)
+
+
+# Batched decision template. Uncomment only when a check is actually cheaper per
+# batch (e.g. a single lookup against an external allow list for all the senders
+# of the batch): while `decide_batch` is defined, every message of the batch is
+# parsed and kept in memory until the decision is made. Each message is a dict
+# with `uid`, `folder`, `message_id`, `from`, `subject`, `date`, `body` and
+# `attachments`; return one decision per message, in the same order.
+#
+# def decide_batch(messages):
+#     allowed = lookup_allowed_senders({sender_address(m) for m in messages})
+#     return [sender_address(m) in allowed and should_create_page(m, m["body"]) for m in messages]
+
+
 def should_create_page(meta, body):
     """
     Default decision function combining a few example rules.
@@ -98,12 +146,11 @@ def should_create_page(meta, body):
             return True
 
         # Example whitelist for senders (modify to suit your world)
-        whitelist = ["orders@example.com", "spedizioni@brt.it", "trusted.com"]
-        if rule_sender_whitelist(whitelist, meta, body):
+        if rule_sender_whitelist(WHITELIST, meta, body):
             return True
 
         # Example: skip marketing from certain domains
-        if not rule_blacklist_domains(["spamdomain.com", "marketing.example"], meta, body):
+        if not rule_blacklist_domains(BLACKLISTED_DOMAINS, meta, body):
             return False
 
         # Example regex: subjects that mention "order #123" style
@@ -125,7 +172,7 @@ def should_create_page(meta, body):
 # 2) Using regex to match order numbers:
 #    if rule_regex_subject(r"order\s+#?\d+", meta, body): ...
 #
-# 3) Returning property overrides (requires wrapper support):
+# 3) Returning property overrides:
 #    return {"create": True, "properties_override": {"Tag": "invoice"}}
 #
 # 4) Custom behavior based on environment variable:
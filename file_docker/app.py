@@ -1,40 +1,164 @@
 # app.py
 import os, ssl, time, email, re, json, sys
+import heapq
+import importlib
+import importlib.util
 import logging
-import requests
+import threading
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
-from imaplib import IMAP4_SSL
+from imaplib import IMAP4, IMAP4_SSL
 from html import unescape
-from bs4 import BeautifulSoup
-from notion_client import Client
+
+# Heavy third-party modules (notion_client, bs4, requests) are imported lazily
+# on first use, so importing this module stays cheap and does not need any
+# environment variable to be set.
 
 # --- Config ---
-NOTION_TOKEN = os.environ["NOTION_TOKEN"]
-LINE_DB_ID = os.environ["LINE_ITEMS_DATABASE_ID"]
-IMAP_HOST = os.environ["IMAP_HOST"]
-IMAP_PORT = int(os.environ.get("IMAP_PORT", "993"))
-IMAP_USER = os.environ["IMAP_USER"]
-IMAP_PASSWORD = os.environ["IMAP_PASSWORD"]
-FOLDERS = [f.strip() for f in os.environ.get("IMAP_FOLDERS", "INBOX").split(",") if f.strip()]
-SINCE_DAYS = int(os.environ.get("SYNC_SINCE_DAYS", "30"))
-BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "50"))
-POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "60"))  # seconds between polls when running continuously
-PROCESSED_STORE_PATH = os.environ.get("PROCESSED_STORE_PATH", "./processed.json")
-SEEN_MAX = int(os.environ.get("SEEN_MAX", "10000"))
-ATTACHMENTS_DIR = os.environ.get("ATTACHMENTS_DIR", "./attachments")
-# Optional: public base URL where saved attachments will be accessible.
-# If set, attachments will be added to Notion as `external` files using this base URL + filename.
-ATTACHMENTS_BASE_URL = os.environ.get("ATTACHMENTS_BASE_URL", "")
-NOTION_UPLOAD_FILES = os.environ.get("NOTION_UPLOAD_FILES", "false").lower() in ("1","true","yes")
-NOTION_VERSION = os.environ.get("NOTION_VERSION", "2025-09-03")
-
-notion = Client(auth=NOTION_TOKEN)
+@dataclass
+class Config:
+	notion_token: str
+	line_db_id: str
+	imap_host: str
+	imap_user: str
+	imap_password: str
+	imap_port: int = 993
+	folders: list[str] = field(default_factory=lambda: ["INBOX"])
+	since_days: int = 30
+	batch_size: int = 50
+	poll_interval: int = 60  # seconds between polls when running continuously
+	processed_store_path: str = "./processed.json"
+	seen_max: int = 10000
+	attachments_dir: str = "./attachments"
+	# Optional: public base URL where saved attachments will be accessible.
+	# If set, attachments will be added to Notion as `external` files using this base URL + filename.
+	attachments_base_url: str = ""
+	notion_upload_files: bool = False
+	notion_version: str = "2025-09-03"
+	# Root URL of the Notion API (override to point at a mock server, e.g. for benchmarks)
+	notion_api_base: str = "https://api.notion.com"
+	notion_rate_delay: float = 0.1  # minimum spacing (s) between Notion requests, shared per token
+	log_level: str = "INFO"  # logging is process-wide: only the environment's LOG_LEVEL is applied by main()
+	name: str = ""  # account label used in multi-account logs (defaults to imap_user)
+
+	@classmethod
+	def from_env(cls, environ=None):
+		"""Build a Config from environment variables (raises KeyError if a required one is missing)."""
+		env = os.environ if environ is None else environ
+		return cls(
+			notion_token=env["NOTION_TOKEN"],
+			line_db_id=env["LINE_ITEMS_DATABASE_ID"],
+			imap_host=env["IMAP_HOST"],
+			imap_user=env["IMAP_USER"],
+			imap_password=env["IMAP_PASSWORD"],
+			imap_port=int(env.get("IMAP_PORT", "993")),
+			folders=[f.strip() for f in env.get("IMAP_FOLDERS", "INBOX").split(",") if f.strip()],
+			since_days=int(env.get("SYNC_SINCE_DAYS", "30")),
+			batch_size=int(env.get("BATCH_SIZE", "50")),
+			poll_interval=int(env.get("POLL_INTERVAL", "60")),
+			processed_store_path=env.get("PROCESSED_STORE_PATH", "./processed.json"),
+			seen_max=int(env.get("SEEN_MAX", "10000")),
+			attachments_dir=env.get("ATTACHMENTS_DIR", "./attachments"),
+			attachments_base_url=env.get("ATTACHMENTS_BASE_URL", ""),
+			notion_upload_files=env.get("NOTION_UPLOAD_FILES", "false").lower() in ("1","true","yes"),
+			notion_version=env.get("NOTION_VERSION", "2025-09-03"),
+			notion_api_base=env.get("NOTION_API_BASE", "https://api.notion.com").rstrip("/"),
+			notion_rate_delay=float(env.get("NOTION_RATE_DELAY", "0.1")),
+			log_level=env.get("LOG_LEVEL", "INFO").upper(),
+			name=env.get("ACCOUNT_NAME", "") or env["IMAP_USER"],
+		)
+
+_config = None
+
+def get_config() -> Config:
+	"""Return the process-wide Config, loading it from the environment on first call."""
+	global _config
+	if _config is None:
+		_config = Config.from_env()
+	return _config
+
+def set_config(cfg: Config):
+	"""Install `cfg` as the process-wide Config (used instead of reading the environment)."""
+	global _config
+	_config = cfg
+
+# Notion clients and rate limiters are shared by every account using the same
+# integration token (Notion rate limits are per integration, not per database).
+_notion_clients = {}
+_rate_limiters = {}
+_notion_lock = threading.Lock()
+
+def get_notion(cfg: Config | None = None):
+	"""Return the Notion client for `cfg`'s token, constructing it on first use."""
+	cfg = cfg or get_config()
+	key = (cfg.notion_token, cfg.notion_api_base)
+	with _notion_lock:
+		client = _notion_clients.get(key)
+		if client is None:
+			from notion_client import Client
+			client = _notion_clients[key] = Client(auth=cfg.notion_token, base_url=cfg.notion_api_base)
+	return client
+
+
+class RateLimiter:
+	"""Space calls at least `interval` seconds apart, across all threads sharing the limiter."""
+
+	def __init__(self, interval: float):
+		self.interval = interval
+		self._lock = threading.Lock()
+		self._next = 0.0
+
+	def wait(self):
+		with self._lock:
+			now = time.monotonic()
+			slot = max(now, self._next)
+			self._next = slot + self.interval
+		if slot > now:
+			time.sleep(slot - now)
+
+	def backoff(self, seconds: float):
+		"""Push the next free slot at least `seconds` into the future (e.g. after a 429)."""
+		with self._lock:
+			self._next = max(self._next, time.monotonic() + seconds)
+
+
+def get_rate_limiter(cfg: Config | None = None) -> RateLimiter:
+	"""Return the RateLimiter shared by every account using `cfg`'s Notion token."""
+	cfg = cfg or get_config()
+	with _notion_lock:
+		limiter = _rate_limiters.get(cfg.notion_token)
+		if limiter is None:
+			limiter = _rate_limiters[cfg.notion_token] = RateLimiter(cfg.notion_rate_delay)
+	return limiter
+
+
+# Attempts for a Notion request answered with 429 before the message is left for the next poll
+NOTION_MAX_ATTEMPTS = 3
+
+
+class NotionRateLimited(Exception):
+	"""A Notion request (page creation or file upload) still rate limited after NOTION_MAX_ATTEMPTS attempts."""
+
+
+def note_rate_limited(cfg: Config, status, headers):
+	"""If a Notion response was a 429, make every user of the token back off for Retry-After seconds."""
+	if status != 429:
+		return False
+	try:
+		delay = float((headers or {}).get("Retry-After", 1))
+	except (TypeError, ValueError):
+		delay = 1.0
+	logger.warning("[%s] Notion rate limited; backing off %.1fs for this token", cfg.name, delay)
+	get_rate_limiter(cfg).backoff(delay)
+	return True
 
 # Logging
-LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(stream=sys.stdout, level=getattr(logging, LOG_LEVEL, logging.INFO), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger("imap-notion-sync")
 
+def configure_logging(log_level: str = "INFO"):
+	logging.basicConfig(stream=sys.stdout, level=getattr(logging, log_level, logging.INFO), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 # --- Utils di decodifica ---
 def qp_decode(s: bytes|str, charset="utf-8"):
 	if isinstance(s, str):
@@ -49,6 +173,7 @@ def qp_decode(s: bytes|str, charset="utf-8"):
 
 def html_to_text(html_str: str) -> str:
 	try:
+		from bs4 import BeautifulSoup
 		soup = BeautifulSoup(html_str, "html.parser")
 		for br in soup.find_all(["br","p","div","tr"]):
 			br.append("\n")
@@ -79,7 +204,7 @@ def get_best_body(msg) -> tuple[str,str]:
 			plain = " ".join(txt.split())
 		elif ct == "text/html":
 			html = txt
-	text = plain or html_to_text(html)
+	text = plain or (html_to_text(html) if html else "")
 	return text, html
 
 
@@ -110,7 +235,7 @@ def is_seen(store: dict, uid: str, msgid: str, folder: str) -> bool:
 		return True
 	return False
 
-def mark_seen(store: dict, uid: str, msgid: str, folder: str):
+def mark_seen(store: dict, uid: str, msgid: str, folder: str, seen_max: int = 10000):
 	fdata = store.setdefault("folders", {})
 	folder_entry = fdata.setdefault(folder, {})
 	ulist = folder_entry.setdefault("uids", [])
@@ -121,11 +246,11 @@ def mark_seen(store: dict, uid: str, msgid: str, folder: str):
 		if not mids or mids[-1] != msgid:
 			mids.append(msgid)
 	# trim
-	if len(ulist) > SEEN_MAX:
-		folder_entry["uids"] = ulist[-SEEN_MAX:]
+	if len(ulist) > seen_max:
+		folder_entry["uids"] = ulist[-seen_max:]
 	mids = store.get("msgids", [])
-	if len(mids) > SEEN_MAX:
-		store["msgids"] = mids[-SEEN_MAX:]
+	if len(mids) > seen_max:
+		store["msgids"] = mids[-seen_max:]
 
 # --- IMAP ---
 def imap_search_since(imap, folder, since_date):
@@ -235,15 +360,18 @@ def imap_search_since(imap, folder, since_date):
 	return filtered
 
 
-def fetch_batch(imap, uids):
+def fetch_batch(imap, uids, query='(RFC822 FLAGS)'):
 	if not uids:
 		return {}
 	seq = ",".join(uids)
 	try:
-		typ, data = imap.uid('fetch', seq, '(RFC822 FLAGS)')
+		typ, data = imap.uid('fetch', seq, query)
 		if typ != "OK" or not data:
 			logger.warning("Empty fetch response for seq=%s (typ=%s)", seq, typ)
 			return {}
+	except (IMAP4.abort, OSError):
+		# connection lost: let the caller close the session without advancing last_sync
+		raise
 	except Exception:
 		logger.exception("UID fetch failed for seq=%s", seq)
 		return {}
@@ -288,44 +416,60 @@ def _safe_filename(name: str) -> str:
     return re.sub(r"[^A-Za-z0-9._-]", "_", name)
 
 
-def create_file_upload_object():
+def notion_post(url: str, what: str, cfg: Config, **kwargs):
+	"""POST to the Notion API and return the JSON response, retrying 429 answers
+	up to NOTION_MAX_ATTEMPTS times. Raises NotionRateLimited if still rate limited."""
+	import requests
+	for attempt in range(1, NOTION_MAX_ATTEMPTS + 1):
+		get_rate_limiter(cfg).wait()
+		resp = requests.post(url, **kwargs)
+		if not note_rate_limited(cfg, resp.status_code, resp.headers):
+			resp.raise_for_status()
+			return resp.json()
+		logger.warning("Notion %s rate limited (attempt %d/%d)", what, attempt, NOTION_MAX_ATTEMPTS)
+	raise NotionRateLimited(what)
+
+
+def create_file_upload_object(cfg: Config | None = None):
 	"""Create a Notion File Upload object (Step 1). Returns the JSON response containing `id` and `upload_url`."""
-	url = "https://api.notion.com/v1/file_uploads"
+	cfg = cfg or get_config()
+	url = f"{cfg.notion_api_base}/v1/file_uploads"
 	headers = {
- 		"Authorization": f"Bearer {NOTION_TOKEN}",
- 		"Notion-Version": NOTION_VERSION,
+ 		"Authorization": f"Bearer {cfg.notion_token}",
+ 		"Notion-Version": cfg.notion_version,
  		"Content-Type": "application/json",
  	}
     
 	try:
-		resp = requests.post(url, headers=headers, json={})
-		resp.raise_for_status()
-		return resp.json()
+		return notion_post(url, "file_upload object", cfg, headers=headers, json={})
+	except NotionRateLimited:
+		raise
 	except Exception:
 		logger.exception("Failed creating Notion file_upload object")
 		return None
 
 
-def send_file_to_upload_url(upload_url: str, file_bytes: bytes, filename: str):
+def send_file_to_upload_url(upload_url: str, file_bytes: bytes, filename: str, cfg: Config | None = None):
 	"""Send file bytes to the upload_url returned by Notion (Step 2). Returns response JSON on success."""
+	cfg = cfg or get_config()
 	headers = {
-		"Authorization": f"Bearer {NOTION_TOKEN}",
-		"Notion-Version": NOTION_VERSION,
+		"Authorization": f"Bearer {cfg.notion_token}",
+		"Notion-Version": cfg.notion_version,
 		# Do not set Content-Type -- requests will set multipart boundary
 	}
 	files = {"file": (filename, file_bytes)}
 	try:
-		resp = requests.post(upload_url, headers=headers, files=files)
-		resp.raise_for_status()
-		return resp.json()
+		return notion_post(upload_url, f"upload of {filename}", cfg, headers=headers, files=files)
+	except NotionRateLimited:
+		raise
 	except Exception:
 		logger.exception("Failed sending file to Notion upload_url %s", upload_url)
 		return None
 
 
-def upload_attachment_and_get_upload_id(file_bytes: bytes, filename: str):
+def upload_attachment_and_get_upload_id(file_bytes: bytes, filename: str, cfg: Config | None = None):
 	"""High-level helper that performs Step 1 and Step 2 and returns the `file_upload.id` on success."""
-	obj = create_file_upload_object()
+	obj = create_file_upload_object(cfg)
 	if not obj:
 		return None
 	upload_url = obj.get("upload_url")
@@ -333,7 +477,7 @@ def upload_attachment_and_get_upload_id(file_bytes: bytes, filename: str):
 	if not upload_url or not upload_id:
 		logger.error("Invalid file_upload object returned: %s", obj)
 		return None
-	resp = send_file_to_upload_url(upload_url, file_bytes, filename)
+	resp = send_file_to_upload_url(upload_url, file_bytes, filename, cfg)
 	if not resp:
 		return None
 	if resp.get("status") != "uploaded":
@@ -347,20 +491,21 @@ def build_notion_file_entry_from_upload_id(upload_id: str, filename: str):
 	return {"name": filename, "type": "file_upload", "file_upload": {"id": upload_id}}
 
 
-def save_attachments_and_get_urls(attachments: list, uid: str):
-	"""Save attachments to ATTACHMENTS_DIR and return list of dicts for Notion files.
-	If ATTACHMENTS_BASE_URL is set, return external URLs that can be used in Notion file property.
+def save_attachments_and_get_urls(attachments: list, uid: str, cfg: Config | None = None):
+	"""Save attachments to `cfg.attachments_dir` and return list of dicts for Notion files.
+	If `cfg.attachments_base_url` is set, return external URLs that can be used in Notion file property.
 	"""
 	if not attachments:
 		return []
-	os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+	cfg = cfg or get_config()
+	os.makedirs(cfg.attachments_dir, exist_ok=True)
 	files_for_notion = []
 	for a in attachments:
 		fn = a.get("filename") or f"attachment_{uid}"
 		safe = _safe_filename(fn)
 		# Prefix with uid to avoid collisions
 		out_name = f"{uid}_{safe}"
-		path = os.path.join(ATTACHMENTS_DIR, out_name)
+		path = os.path.join(cfg.attachments_dir, out_name)
 		data = a.get("data") or b""
 		# Save locally first (for persistence / fallback)
 		try:
@@ -371,20 +516,23 @@ def save_attachments_and_get_urls(attachments: list, uid: str):
 			continue
 
 		# If direct Notion upload enabled, try that first
-		if NOTION_UPLOAD_FILES:
+		if cfg.notion_upload_files:
 			try:
-				upload_id = upload_attachment_and_get_upload_id(data, out_name)
+				upload_id = upload_attachment_and_get_upload_id(data, out_name, cfg)
 				if upload_id:
 					files_for_notion.append(build_notion_file_entry_from_upload_id(upload_id, out_name))
 					# Uploaded and attached later when creating the page
 					continue
+			except NotionRateLimited:
+				# leave the whole message for the next poll rather than dropping the file
+				raise
 			except Exception:
 				logger.exception("Notion direct upload failed for %s; falling back to external/local URL", out_name)
 
 		# If base URL provided, create external reference
-		if ATTACHMENTS_BASE_URL:
+		if cfg.attachments_base_url:
 			# Ensure trailing slash
-			base = ATTACHMENTS_BASE_URL.rstrip("/")
+			base = cfg.attachments_base_url.rstrip("/")
 			url = f"{base}/{out_name}"
 			files_for_notion.append({"name": out_name, "type": "external", "external": {"url": url}})
 		else:
@@ -392,7 +540,24 @@ def save_attachments_and_get_urls(attachments: list, uid: str):
 	return files_for_notion
 
 # --- Notion: inserimento email ---
-def create_email_page(msgid, sender, subject, dt, text, attachment_files=None):
+def notion_property_value(value):
+	"""Convert a plugin `properties_override` value into a Notion property value.
+	Dicts are passed through unchanged (already in Notion format); str -> rich_text,
+	list of str -> multi_select, bool -> checkbox, int/float -> number.
+	"""
+	if isinstance(value, dict):
+		return value
+	if isinstance(value, bool):
+		return {"checkbox": value}
+	if isinstance(value, (int, float)):
+		return {"number": value}
+	if isinstance(value, (list, tuple)):
+		return {"multi_select": [{"name": str(v)} for v in value]}
+	return {"rich_text": [{"type": "text", "text": {"content": str(value)}}]}
+
+
+def create_email_page(msgid, sender, subject, dt, text, attachment_files=None, cfg=None, properties_override=None):
+	cfg = cfg or get_config()
 	props = {
 		"Message-ID": {"rich_text":[{"type":"text","text":{"content": msgid}}]} if msgid else {"rich_text":[]},
 		"From": {"rich_text":[{"type":"text","text":{"content": sender}}]} if sender else {"rich_text":[]},
@@ -406,18 +571,27 @@ def create_email_page(msgid, sender, subject, dt, text, attachment_files=None):
 		# Notion file properties use the key name of the property and a `files` list
 		props["Attachments"] = {"files": attachment_files}
 
-	try:
-		logger.debug("Creating Notion page for Message-ID=%s Subject=%s", (msgid or "" )[:80], (subject or "")[:80])
-		page = notion.pages.create(parent={"database_id": LINE_DB_ID}, properties=props)
-		logger.info("Notion page created: %s", page.get("id") if isinstance(page, dict) else "(unknown)")
-		return page
-	except Exception:
-		logger.exception("Failed to create Notion page for Message-ID=%s", msgid)
-		return None
+	# Property overrides returned by the filter plugin
+	for name, value in (properties_override or {}).items():
+		props[name] = notion_property_value(value)
+
+	logger.debug("Creating Notion page for Message-ID=%s Subject=%s", (msgid or "" )[:80], (subject or "")[:80])
+	for attempt in range(1, NOTION_MAX_ATTEMPTS + 1):
+		try:
+			get_rate_limiter(cfg).wait()
+			page = get_notion(cfg).pages.create(parent={"database_id": cfg.line_db_id}, properties=props)
+			logger.info("Notion page created: %s", page.get("id") if isinstance(page, dict) else "(unknown)")
+			return page
+		except Exception as e:
+			if not note_rate_limited(cfg, getattr(e, "status", None), getattr(e, "headers", None)):
+				logger.exception("Failed to create Notion page for Message-ID=%s", msgid)
+				return None
+			logger.warning("Notion page for Message-ID=%s rate limited (attempt %d/%d)", (msgid or "")[:80], attempt, NOTION_MAX_ATTEMPTS)
+	raise NotionRateLimited(msgid)
 
 # --- Parse headers minimi ---
-def parse_email_metadata(raw_bytes):
-	m = email.message_from_bytes(raw_bytes)
+def parse_headers(m):
+	"""Return (msgid, sender, subject, dt) decoded from the headers of message `m`."""
 	def get_header(k):
 		v = email.header.decode_header(m.get(k, "")); s = ""
 		for part, enc in v:
@@ -428,6 +602,11 @@ def parse_email_metadata(raw_bytes):
 	subject = get_header("Subject") or ""
 	date_tuple = email.utils.parsedate_tz(m.get("Date"))
 	dt = datetime.fromtimestamp(email.utils.mktime_tz(date_tuple), tz=timezone.utc) if date_tuple else datetime.now(timezone.utc)
+	return msgid, sender, subject, dt
+
+def parse_email_metadata(raw_bytes):
+	m = email.message_from_bytes(raw_bytes)
+	msgid, sender, subject, dt = parse_headers(m)
 	text, _ = get_best_body(m)
 
 	# Extract attachments (filename + bytes + content_type)
@@ -452,20 +631,479 @@ def parse_email_metadata(raw_bytes):
 	logger.debug("Parsed email headers: Message-ID=%s From=%s Subject=%s Date=%s attachments=%d", (msgid or "")[:80], (sender or "")[:80], (subject or "")[:80], dt.isoformat(), len(attachments))
 	return msgid, sender, subject, dt, text, attachments
 
+# --- Plugin ---
+# A filter plugin is a plain module (see custom_filter.py) exposing any of:
+# - on_headers(meta) -> decision: called with headers only, before the body is fetched
+# - decide_batch(messages) -> [decision, ...]: called once per batch of parsed messages
+# - should_create_page(meta, body) -> decision: legacy per-message hook (used if decide_batch is missing)
+# A decision is True (create), False/None (skip) or a dict
+# {"create": bool, "properties_override": {...}}.
+
+def normalize_decision(decision) -> tuple[bool, dict]:
+	"""Turn a plugin decision into (create, properties_override)."""
+	if isinstance(decision, dict):
+		return bool(decision.get("create", True)), decision.get("properties_override") or {}
+	return bool(decision), {}
+
+
+class Plugin:
+	"""Filter plugin wrapping an imported module, reloaded when its source file changes."""
+
+	def __init__(self, module):
+		self.module = module
+		self.name = module.__name__
+		self._lock = threading.Lock()
+		self._mtime = self._stat()
+
+	def _stat(self):
+		try:
+			return os.stat(self.module.__file__).st_mtime
+		except Exception:
+			return None
+
+	def refresh(self):
+		"""Reload the plugin module if its file changed since it was (re)loaded."""
+		mtime = self._stat()
+		if mtime is None or mtime == self._mtime:
+			return
+		with self._lock:
+			if mtime == self._mtime:
+				return
+			self._mtime = mtime
+			# Execute the new source in a fresh module object (importlib.reload would
+			# re-run it over the old namespace, keeping hooks deleted from the file)
+			# and swap it in only if it loads cleanly.
+			try:
+				spec = importlib.util.spec_from_file_location(self.name, self.module.__file__)
+				module = importlib.util.module_from_spec(spec)
+				spec.loader.exec_module(module)
+			except Exception:
+				logger.exception("Error reloading custom filter module '%s'; keeping previous version", self.name)
+				return
+			self.module = sys.modules[self.name] = module
+			logger.info("Reloaded custom filter module: %s", self.name)
+
+	def has(self, hook: str) -> bool:
+		return callable(getattr(self.module, hook, None))
+
+	def on_headers(self, meta: dict) -> tuple[bool, dict]:
+		try:
+			return normalize_decision(self.module.on_headers(meta))
+		except Exception:
+			logger.exception("%s.on_headers raised an exception; defaulting to create", self.name)
+			return True, {}
+
+	def decide(self, messages: list) -> list[tuple[bool, dict]]:
+		"""Return one (create, properties_override) per message, via decide_batch or should_create_page."""
+		module = self.module
+		if callable(getattr(module, "decide_batch", None)):
+			try:
+				decisions = list(module.decide_batch(messages))
+				if len(decisions) == len(messages):
+					return [normalize_decision(d) for d in decisions]
+				logger.error("%s.decide_batch returned %d decisions for %d messages; defaulting to create", self.name, len(decisions), len(messages))
+			except Exception:
+				logger.exception("%s.decide_batch raised an exception; defaulting to create", self.name)
+			return [(True, {}) for _ in messages]
+		if callable(getattr(module, "should_create_page", None)):
+			out = []
+			for m in messages:
+				meta = {k: m[k] for k in ("message_id", "from", "subject", "date")}
+				try:
+					out.append(normalize_decision(module.should_create_page(meta, m["body"])))
+				except Exception:
+					logger.exception("%s.should_create_page raised an exception; defaulting to create", self.name)
+					out.append((True, {}))
+			return out
+		return [(True, {}) for _ in messages]
+
+
+_plugin = None
+
+def load_plugin(module_name: str):
+	"""Import `module_name` as the filter plugin; returns None if it is missing or fails to load."""
+	global _plugin
+	try:
+		module = importlib.import_module(module_name)
+	except ModuleNotFoundError as e:
+		if e.name != module_name:
+			logger.exception("Error loading custom filter module '%s' - running default behavior", module_name)
+		else:
+			logger.info("No custom filter module '%s' found - running default behavior", module_name)
+		return None
+	except Exception:
+		logger.exception("Error loading custom filter module '%s' - running default behavior", module_name)
+		return None
+	_plugin = Plugin(module)
+	logger.info("Loaded custom filter module: %s", module_name)
+	return _plugin
+
+def get_plugin():
+	return _plugin
+
 # --- Main ---
+def parse_message(uid, item, folder):
+	"""Parse a fetched message into the dict handed to plugins and to process_message."""
+	msgid, sender, subject, dt, text, attachments = parse_email_metadata(item["raw"])
+	return {
+		"uid": uid,
+		"folder": folder,
+		"message_id": msgid,
+		"from": sender,
+		"subject": subject,
+		"date": dt,
+		"body": text,
+		"attachments": attachments,
+	}
+
+
+def process_message(msg, store, cfg=None, properties_override=None):
+	"""Create the Notion page for a parsed message and mark it as processed.
+	Returns False if Notion was still rate limited (page or attachment upload), leaving the message for the next poll."""
+	cfg = cfg or get_config()
+	uid, msgid, folder = msg["uid"], msg["message_id"], msg["folder"]
+	try:
+		# Save attachments and obtain Notion file entries (external) if possible
+		attachment_files = save_attachments_and_get_urls(msg["attachments"], uid, cfg)
+		if msg["body"]:
+			logger.debug("Creating page for Message-ID=%s", (msgid or "")[:80])
+			page = create_email_page(msgid, msg["from"], msg["subject"], msg["date"], msg["body"], attachment_files=attachment_files, cfg=cfg, properties_override=properties_override)
+	except NotionRateLimited:
+		logger.warning("Giving up on uid=%s for this poll (Notion rate limited); not marking it processed", uid)
+		return False
+	if msg["body"]:
+		# mark as processed and persist
+		try:
+			mark_seen(store, uid, msgid, folder, cfg.seen_max)
+			save_store(cfg.processed_store_path, store)
+		except Exception:
+			logger.exception("Failed marking message seen for uid=%s", uid)
+	return True
+
+
+def skip_message(uid, msgid, folder, store, cfg, reason):
+	"""Record a message rejected by the plugin so it is not evaluated again."""
+	logger.info("custom filter %s prevented creation for uid=%s Message-ID=%s", reason, uid, (msgid or "")[:80])
+	mark_seen(store, uid, msgid, folder, cfg.seen_max)
+	save_store(cfg.processed_store_path, store)
+
+
+def header_meta(uid, folder, msgid, sender, subject, dt) -> dict:
+	"""The `meta` dict passed to the plugin's on_headers hook."""
+	return {"uid": uid, "folder": folder, "message_id": msgid, "from": sender, "subject": subject, "date": dt}
+
+
+def filter_on_headers(imap, batch, folder, store, plugin, cfg):
+	"""Fetch only the headers of `batch` and drop seen messages and those rejected by on_headers.
+	Returns (kept uids, {uid: properties_override} from on_headers dict decisions,
+	set of kept uids whose headers could not be fetched or parsed, so on_headers
+	still has to run on the full message)."""
+	headers = fetch_batch(imap, batch, '(BODY.PEEK[HEADER])')
+	keep, batch_ids, overrides, pending = [], set(), {}, set()
+	for uid in batch:
+		item = headers.get(uid)
+		if not item:
+			# No headers available: let the full fetch decide
+			keep.append(uid)
+			pending.add(uid)
+			continue
+		try:
+			msgid, sender, subject, dt = parse_headers(email.message_from_bytes(item["raw"]))
+		except Exception:
+			logger.exception("Failed parsing headers for uid %s", uid)
+			keep.append(uid)
+			pending.add(uid)
+			continue
+		if is_seen(store, uid, msgid, folder) or (msgid and msgid in batch_ids):
+			logger.info("Skipping already-processed message uid=%s msgid=%s", uid, (msgid or "")[:80])
+			continue
+		batch_ids.add(msgid)
+		create, props = plugin.on_headers(header_meta(uid, folder, msgid, sender, subject, dt))
+		if create:
+			keep.append(uid)
+			if props:
+				overrides[uid] = props
+		else:
+			skip_message(uid, msgid, folder, store, cfg, "on_headers")
+	return keep, overrides, pending
+
+
+def apply_decision(msg, decision, store, cfg, header_overrides=None) -> int:
+	"""Create or skip `msg` according to a plugin decision.
+	Overrides from on_headers are applied first, then those of the later decision.
+	Returns 1 if the message was deferred by Notion rate limiting, else 0."""
+	create, overrides = decision
+	if header_overrides:
+		overrides = {**header_overrides, **overrides}
+	try:
+		if create:
+			return 1 if process_message(msg, store, cfg, properties_override=overrides) is False else 0
+		skip_message(msg["uid"], msg["message_id"], msg["folder"], store, cfg, "decision")
+	except Exception:
+		logger.exception("Failed processing uid %s", msg["uid"])
+	return 0
+
+
+def process_batch(imap, batch, folder, store, cfg=None):
+	"""Fetch a batch of UIDs from the currently selected folder and process each message.
+	Returns the number of messages deferred to the next poll because of Notion rate limiting.
+
+	With a plugin loaded, on_headers runs on a header-only fetch first (rejected
+	messages are never downloaded). If the plugin defines decide_batch, the batch
+	is parsed and decided in one call; otherwise each message is parsed, decided
+	and processed in turn, so only one parsed message is held at a time.
+	"""
+	cfg = cfg or get_config()
+	plugin = get_plugin()
+	header_overrides, headers_pending = {}, set()
+	if plugin is not None:
+		plugin.refresh()
+		if plugin.has("on_headers"):
+			batch, header_overrides, headers_pending = filter_on_headers(imap, batch, folder, store, plugin, cfg)
+	batched = plugin is not None and plugin.has("decide_batch")
+
+	results = fetch_batch(imap, batch)
+	messages, batch_ids, deferred = [], set(), 0
+	for uid in batch:
+		item = results.get(uid)
+		if not item:
+			logger.warning("No data for uid %s (skipping)", uid)
+			continue
+		try:
+			msg = parse_message(uid, item, folder)
+		except Exception:
+			logger.exception("Failed processing uid %s", uid)
+			continue
+		# Dedup: skip if we've already processed this Message-ID or UID (or seen it earlier in this batch)
+		msgid = msg["message_id"]
+		if is_seen(store, uid, msgid, folder) or (msgid and msgid in batch_ids):
+			logger.info("Skipping already-processed message uid=%s msgid=%s", uid, (msgid or "")[:80])
+			continue
+		batch_ids.add(msgid)
+		if uid in headers_pending:
+			# on_headers was skipped for this message: run it now on the parsed headers
+			create, props = plugin.on_headers(header_meta(uid, folder, msgid, msg["from"], msg["subject"], msg["date"]))
+			if not create:
+				skip_message(uid, msgid, folder, store, cfg, "on_headers")
+				continue
+			if props:
+				header_overrides[uid] = props
+		if batched:
+			messages.append(msg)
+		else:
+			decision = plugin.decide([msg])[0] if plugin is not None else (True, {})
+			deferred += apply_decision(msg, decision, store, cfg, header_overrides.get(uid))
+
+	if messages:
+		for msg, decision in zip(messages, plugin.decide(messages)):
+			deferred += apply_decision(msg, decision, store, cfg, header_overrides.get(msg["uid"]))
+	return deferred
+
+
+def poll_once(context, store, last_sync, initial_since, cfg=None):
+	"""Run a single poll cycle: connect to IMAP and sync every folder in `cfg.folders`."""
+	cfg = cfg or get_config()
+	logger.info("Connecting to IMAP %s:%s", cfg.imap_host, cfg.imap_port)
+	with IMAP4_SSL(cfg.imap_host, cfg.imap_port, ssl_context=context) as imap:
+		imap.login(cfg.imap_user, cfg.imap_password)
+		logger.info("IMAP login successful for user %s", cfg.imap_user)
+
+		for folder in cfg.folders:
+			since_date = last_sync.get(folder, initial_since)
+			uids = imap_search_since(imap, folder, since_date)
+			logger.info("Folder '%s' has %d messages since %s", folder, len(uids), since_date.date().isoformat())
+
+			deferred = 0
+			for i in range(0, len(uids), cfg.batch_size):
+				batch = uids[i:i+cfg.batch_size]
+				logger.info("Processing batch %d: %d messages", (i // cfg.batch_size) + 1, len(batch))
+				deferred += process_batch(imap, batch, folder, store, cfg)
+
+			# update last sync timestamp for the folder to now, unless some
+			# messages were deferred: they must be found again by the next search
+			if deferred:
+				logger.warning("Folder '%s': %d messages deferred by Notion rate limiting; keeping last sync at %s", folder, deferred, since_date.isoformat())
+			else:
+				last_sync[folder] = datetime.now(timezone.utc)
+
+		try:
+			imap.logout()
+			logger.info("IMAP logout complete")
+		except Exception:
+			logger.debug("Error during IMAP logout (continuing)")
+
+
+# --- Multi-account ---
+def load_accounts(path: str, environ=None) -> list[Config]:
+	"""Read a JSON list of accounts and return one Config per account.
+
+	Each entry uses the same keys as the environment (IMAP_USER, IMAP_PASSWORD,
+	LINE_ITEMS_DATABASE_ID, NOTION_TOKEN, IMAP_FOLDERS, ...) plus an optional
+	ACCOUNT_NAME; missing keys fall back to the process environment. Unless an
+	entry sets them, PROCESSED_STORE_PATH and ATTACHMENTS_DIR are made unique
+	per account so dedup stores and saved files never collide.
+	"""
+	env = os.environ if environ is None else environ
+	with open(path, "r", encoding="utf-8") as f:
+		entries = json.load(f)
+	configs = []
+	for entry in entries:
+		overrides = {k: ",".join(v) if isinstance(v, list) else str(v) for k, v in entry.items()}
+		cfg = Config.from_env({**env, **overrides})
+		safe = _safe_filename(cfg.name)
+		if "PROCESSED_STORE_PATH" not in overrides:
+			root, ext = os.path.splitext(cfg.processed_store_path)
+			cfg.processed_store_path = f"{root}.{safe}{ext or '.json'}"
+		if "ATTACHMENTS_DIR" not in overrides:
+			cfg.attachments_dir = os.path.join(cfg.attachments_dir, safe)
+		configs.append(cfg)
+	if not configs:
+		raise ValueError(f"No accounts found in {path}")
+	stores = [c.processed_store_path for c in configs]
+	if len(set(stores)) != len(stores):
+		raise ValueError(f"Accounts in {path} must have distinct ACCOUNT_NAME / PROCESSED_STORE_PATH")
+	return configs
+
+
+class AccountSession:
+	"""Per-account state for multi-account mode: IMAP session, dedup store and pending work.
+
+	A poll cycle is split into small steps (search one folder, or process one
+	batch) so the scheduler can interleave accounts between steps.
+	"""
+
+	def __init__(self, cfg: Config, context):
+		self.cfg = cfg
+		self.context = context
+		self.store = load_store(cfg.processed_store_path)
+		self.initial_since = (datetime.now(timezone.utc) - timedelta(days=cfg.since_days)).astimezone(timezone.utc)
+		self.last_sync = {f: self.initial_since for f in cfg.folders}
+		self.imap = None
+		self.pending = deque()
+		self.deferred = set()  # folders with messages left for the next cycle
+
+	def _connect(self):
+		cfg = self.cfg
+		logger.info("[%s] Connecting to IMAP %s:%s", cfg.name, cfg.imap_host, cfg.imap_port)
+		self.imap = IMAP4_SSL(cfg.imap_host, cfg.imap_port, ssl_context=self.context)
+		self.imap.login(cfg.imap_user, cfg.imap_password)
+		self.pending.extend(("search", folder) for folder in cfg.folders)
+
+	def _close(self):
+		self.pending.clear()
+		self.deferred.clear()
+		if self.imap is not None:
+			try:
+				self.imap.logout()
+			except Exception:
+				logger.debug("[%s] Error during IMAP logout (continuing)", self.cfg.name)
+			self.imap = None
+
+	def step(self) -> float:
+		"""Run one unit of work and return the monotonic time at which to run again."""
+		cfg = self.cfg
+		try:
+			if self.imap is None:
+				self._connect()
+			if self.pending:
+				kind, folder, *rest = self.pending.popleft()
+				if kind == "search":
+					since_date = self.last_sync.get(folder, self.initial_since)
+					uids = imap_search_since(self.imap, folder, since_date)
+					logger.info("[%s] Folder '%s' has %d messages since %s", cfg.name, folder, len(uids), since_date.date().isoformat())
+					work = [("batch", folder, uids[i:i+cfg.batch_size]) for i in range(0, len(uids), cfg.batch_size)]
+					work.append(("done", folder))
+					self.pending.extendleft(reversed(work))
+				elif kind == "batch":
+					# the session may have sat idle while other accounts ran: make sure it is
+					# still alive, otherwise abort here and retry the folder next cycle
+					self.imap.noop()
+					if process_batch(self.imap, rest[0], folder, self.store, cfg):
+						self.deferred.add(folder)
+				elif folder in self.deferred:
+					# keep last_sync so rate-limited messages are found again next cycle
+					self.deferred.discard(folder)
+				else:
+					self.last_sync[folder] = datetime.now(timezone.utc)
+			if self.pending:
+				return time.monotonic()
+			self._close()
+			logger.info("[%s] Poll cycle complete; next in %ss", cfg.name, cfg.poll_interval)
+		except Exception:
+			logger.exception("[%s] Unhandled exception during IMAP poll cycle - will retry after sleep", cfg.name)
+			self._close()
+		return time.monotonic() + cfg.poll_interval
+
+
+def run_accounts(configs: list[Config], workers: int):
+	"""Sync many accounts on a shared pool of `workers` threads, forever.
+
+	Each account has at most one step in flight (its IMAP session is not
+	thread-safe). Due accounts are served oldest-first, and an account that
+	still has work is re-queued behind the others, so a huge mailbox only gets
+	one batch per turn and cannot starve the small ones.
+	"""
+	from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+	context = ssl.create_default_context()
+	sessions = [AccountSession(cfg, context) for cfg in configs]
+	seq = 0
+	queue = []  # heap of (due_time, seq, session)
+	for s in sessions:
+		heapq.heappush(queue, (time.monotonic(), seq, s))
+		seq += 1
+	logger.info("Starting multi-account sync: %d accounts, %d workers", len(sessions), workers)
+
+	with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync") as pool:
+		running = {}
+		while True:
+			now = time.monotonic()
+			while queue and queue[0][0] <= now and len(running) < workers:
+				_, _, s = heapq.heappop(queue)
+				running[pool.submit(s.step)] = s
+			timeout = None
+			if queue and len(running) < workers:
+				timeout = max(0.0, queue[0][0] - now)
+			if not running:
+				time.sleep(timeout or 0)
+				continue
+			done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+			for fut in done:
+				s = running.pop(fut)
+				try:
+					due = fut.result()
+				except Exception:
+					logger.exception("[%s] Account step failed", s.cfg.name)
+					due = time.monotonic() + s.cfg.poll_interval
+				heapq.heappush(queue, (due, seq, s))
+				seq += 1
+
+
 def main():
-	logger.info("Starting imap-notion-sync (continuous mode: poll interval=%ss)", POLL_INTERVAL)
+	configure_logging(os.environ.get("LOG_LEVEL", "INFO").upper())
+	plugin_module = os.environ.get("CUSTOM_FILTER_MODULE")
+	if plugin_module:
+		load_plugin(plugin_module)
+
+	accounts_file = os.environ.get("ACCOUNTS_FILE")
+	if accounts_file:
+		configs = load_accounts(accounts_file)
+		run_accounts(configs, int(os.environ.get("SYNC_WORKERS", "4")))
+		return
+
+	cfg = get_config()
+	logger.info("Starting imap-notion-sync (continuous mode: poll interval=%ss)", cfg.poll_interval)
 	context = ssl.create_default_context()
 
 	# Load processed store (keeps track of seen Message-IDs and UIDs to avoid duplicates)
-	store = load_store(PROCESSED_STORE_PATH)
-	logger.debug("Loaded processed store from %s: folders=%d msgids=%d", PROCESSED_STORE_PATH, len(store.get("folders", {})), len(store.get("msgids", [])))
+	store = load_store(cfg.processed_store_path)
+	logger.debug("Loaded processed store from %s: folders=%d msgids=%d", cfg.processed_store_path, len(store.get("folders", {})), len(store.get("msgids", [])))
 
 	# Initialize last sync timestamps per folder (first run: SYNC_SINCE_DAYS back)
 	last_sync = {}
 	now = datetime.now(timezone.utc)
-	initial_since = (now - timedelta(days=SINCE_DAYS)).astimezone(timezone.utc)
-	for f in FOLDERS:
+	initial_since = (now - timedelta(days=cfg.since_days)).astimezone(timezone.utc)
+	for f in cfg.folders:
 		last_sync[f] = initial_since
   
 	# print the last_sync dict 
@@ -473,62 +1111,14 @@ def main():
 
 	while True:
 		try:
-			logger.info("Connecting to IMAP %s:%s", IMAP_HOST, IMAP_PORT)
-			with IMAP4_SSL(IMAP_HOST, IMAP_PORT, ssl_context=context) as imap:
-				imap.login(IMAP_USER, IMAP_PASSWORD)
-				logger.info("IMAP login successful for user %s", IMAP_USER)
-
-				for folder in FOLDERS:
-					since_date = last_sync.get(folder, initial_since)
-					uids = imap_search_since(imap, folder, since_date)
-					logger.info("Folder '%s' has %d messages since %s", folder, len(uids), since_date.date().isoformat())
-
-					for i in range(0, len(uids), BATCH_SIZE):
-						batch = uids[i:i+BATCH_SIZE]
-						logger.info("Processing batch %d: %d messages", (i // BATCH_SIZE) + 1, len(batch))
-						results = fetch_batch(imap, batch)
-						for uid in batch:
-							item = results.get(uid)
-							if not item:
-								logger.warning("No data for uid %s (skipping)", uid)
-								continue
-							try:
-								msgid, sender, subject, dt, text, attachments = parse_email_metadata(item["raw"])
-								# Dedup: skip if we've already processed this Message-ID or UID
-								if is_seen(store, uid, msgid, folder):
-									logger.info("Skipping already-processed message uid=%s msgid=%s", uid, (msgid or "")[:80])
-									continue
-								# Save attachments and obtain Notion file entries (external) if possible
-								attachment_files = save_attachments_and_get_urls(attachments, uid)
-								if text:
-									logger.debug("Creating page for Message-ID=%s", (msgid or "")[:80])
-									page = create_email_page(msgid, sender, subject, dt, text, attachment_files=attachment_files)
-									# mark as processed and persist
-									try:
-										mark_seen(store, uid, msgid, folder)
-										save_store(PROCESSED_STORE_PATH, store)
-									except Exception:
-										logger.exception("Failed marking message seen for uid=%s", uid)
-									time.sleep(0.1)  # rate-limit Notion
-							except Exception:
-								logger.exception("Failed processing uid %s", uid)
-
-					# update last sync timestamp for the folder to now
-					last_sync[folder] = datetime.now(timezone.utc)
-
-				try:
-					imap.logout()
-					logger.info("IMAP logout complete")
-				except Exception:
-					logger.debug("Error during IMAP logout (continuing)")
-
+			poll_once(context, store, last_sync, initial_since, cfg)
 		except Exception:
 			logger.exception("Unhandled exception during IMAP poll cycle - will retry after sleep")
 
 		logger.info("Last Sync timestamps per folder: %s", {k: v.isoformat() for k,v in last_sync.items()})
 		# Sleep before next poll (keeps container alive)
-		logger.info("Sleeping %s seconds before next poll", POLL_INTERVAL)
-		time.sleep(POLL_INTERVAL)
+		logger.info("Sleeping %s seconds before next poll", cfg.poll_interval)
+		time.sleep(cfg.poll_interval)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file